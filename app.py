@@ -1,14 +1,33 @@
-from flask import Flask, render_template, request, redirect, url_for, jsonify, current_app, flash, send_file
+from flask import Flask, render_template, request, redirect, url_for, jsonify, current_app, flash, send_file, Response
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager, UserMixin, login_user, logout_user, current_user, login_required
 from werkzeug.security import generate_password_hash, check_password_hash
 import io
 import numpy as np
-import pandas as pd
+import xlsxwriter
 import os
+import threading
 import json
-from sqlalchemy import desc
+import orjson
+from functools import lru_cache
+from sqlalchemy import delete, desc, func, inspect, select, text
+from sqlalchemy.exc import DBAPIError
 from dotenv import load_dotenv # Import dotenv
+from pydantic import BaseModel, Field, ValidationError, model_validator
+from typing import List, Literal, Optional, Union
+
+# Numba is optional: without it the pricing kernels run as plain Python
+try:
+    from numba import njit, prange
+    HAS_NUMBA = True
+except ImportError:
+    HAS_NUMBA = False
+    prange = range
+
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda f: f
 
 # Load environment variables from .env file (for local testing)
 load_dotenv() 
@@ -30,6 +49,13 @@ login_manager.login_message_category = 'info'
 # Define the Super Admin's unique identifier for security
 SUPER_ADMIN_USERNAME = 'Grid.Thoma'
 
+# Explicit PBKDF2 work factor for new hashes; werkzeug's default (scrypt, or 600k-iteration
+# PBKDF2 on older versions) dominates login latency. Existing hashes verify unchanged.
+PASSWORD_HASH_METHOD = 'pbkdf2:sha256:150000'
+
+# Number of saved calculations kept per user
+MAX_HISTORY = 15
+
 # --- HELPER FUNCTIONS & DECORATORS ---
 
 # Custom decorator to ensure only admins can access a route
@@ -56,18 +82,26 @@ class User(db.Model, UserMixin):
     password_hash = db.Column(db.String(256))
     is_admin = db.Column(db.Boolean, default=False)
     is_super_admin = db.Column(db.Boolean, default=False)
+    # Partial index covering only the (few) Super Admin rows, for the last-Super-Admin checks.
+    # username and email are already indexed through their unique constraints.
+    __table_args__ = (
+        db.Index(
+            'ix_user_super_admin', 'is_super_admin',
+            postgresql_where=(is_super_admin == True), sqlite_where=(is_super_admin == True)
+        ),
+    )
     # Ensure cascade="all, delete-orphan" and passive_deletes=True 
     calculations = db.relationship(
         'Calculation', 
         backref='author', 
-        lazy='dynamic', 
+        lazy='select', 
         order_by='Calculation.timestamp.asc()',
         cascade="all, delete-orphan", 
         passive_deletes=True
     )
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = generate_password_hash(password, method=PASSWORD_HASH_METHOD)
 
     def check_password(self, password):
         return check_password_hash(self.password_hash, password)
@@ -76,22 +110,91 @@ class User(db.Model, UserMixin):
         return f"User('{self.username}', '{self.email}', Admin: {self.is_admin}, Super: {self.is_super_admin})"
 
 class Calculation(db.Model):
+    # History reads and the oldest-row trim both filter on user_id and order by timestamp
+    __table_args__ = (db.Index('ix_calc_user_ts', 'user_id', 'timestamp'),)
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
     timestamp = db.Column(db.DateTime, default=db.func.now())
     # Store inputs and results as JSON strings
     input_params_json = db.Column(db.Text, nullable=False)
     output_summary_json = db.Column(db.Text, nullable=False)
+    # Copy of output_summary_json['initial_option_value'] so the history list needs no JSON decoding
+    initial_option_value = db.Column(db.Float)
 
     def __repr__(self):
         return f"Calculation('{self.timestamp}', UserID: {self.user_id})"
 
+# --- REQUEST SCHEMAS ---
+
+class CalcInput(BaseModel):
+    # Body of POST /calculate. The form sends numbers as strings; pydantic coerces them.
+    V: float
+    K: float
+    T: float
+    sigma: float
+    r: float
+    # Auto mode: the initial cost of delay. Manual mode: comma-separated values for t=0..n-1.
+    # Parsed by parse_delta into a float or a list of floats respectively.
+    delta: Union[float, List[float], str]
+    delta_mode: Literal['auto', 'manual'] = Field('auto', alias='delta-mode')
+    export: Optional[str] = None
+
+    @model_validator(mode='after')
+    def parse_delta(self):
+        if self.delta_mode == 'auto':
+            try:
+                self.delta = float(self.delta)
+            except (TypeError, ValueError):
+                raise ValueError('Initial Cost of Delay must be a valid number.')
+        elif not isinstance(self.delta, list):
+            try:
+                self.delta = [float(d.strip()) for d in str(self.delta).split(',')] if self.delta != '' else []
+            except ValueError:
+                raise ValueError('Manual Cost of Delay values must be valid numbers.')
+        return self
+
 # --- INITIAL SETUP ---
 
+def upgrade_schema():
+    # db.create_all() never alters existing tables, so columns added to the models
+    # after the first deploy are created (and backfilled) here. Every gunicorn worker
+    # runs this while booting, so each step tolerates another worker having done it first.
+    columns = {col['name'] for col in inspect(db.engine).get_columns('calculation')}
+    if 'initial_option_value' not in columns:
+        try:
+            # Column and backfill share a transaction, so only the worker that adds it fills it
+            with db.engine.begin() as conn:
+                conn.execute(text('ALTER TABLE calculation ADD COLUMN initial_option_value FLOAT'))
+                rows = conn.execute(text('SELECT id, output_summary_json FROM calculation')).all()
+                if rows:
+                    conn.execute(
+                        text('UPDATE calculation SET initial_option_value = :value WHERE id = :id'),
+                        [{'value': json.loads(output_summary_json).get('initial_option_value'), 'id': calc_id}
+                         for calc_id, output_summary_json in rows]
+                    )
+            print("Added column 'calculation.initial_option_value'.")
+        except DBAPIError:
+            columns = {col['name'] for col in inspect(db.engine).get_columns('calculation')}
+            if 'initial_option_value' not in columns:
+                raise
+
+    for table in (User.__table__, Calculation.__table__):
+        index_names = {ix['name'] for ix in inspect(db.engine).get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in index_names:
+                try:
+                    index.create(db.engine)
+                    print(f"Added index '{index.name}'.")
+                except DBAPIError:
+                    if index.name not in {ix['name'] for ix in inspect(db.engine).get_indexes(table.name)}:
+                        raise
+
 def create_default_admin():
     with app.app_context():
         # NOTE: db.create_all() will create tables in the DATABASE_URL connection
         db.create_all()
+        upgrade_schema()
         
         # Super Admin check (Grid.Thoma)
         if User.query.filter_by(username=SUPER_ADMIN_USERNAME).first() is None:
@@ -110,67 +213,177 @@ def create_default_admin():
 
 # --- ORIGINAL CALCULATION HELPER FUNCTIONS (Assuming correct) ---
 
+def tree_steps(T):
+    # One step per whole year, at least one step; shared by /calculate and the sensitivity runs
+    return max(1, int(T))
+
 def binomial_parameters(sigma, r, delta, dt):
     u = np.exp(sigma * np.sqrt(dt))
     d = 1 / u
     p = (np.exp((r - delta) * dt) - d) / (u - d)
     return u, d, p
 
-def calculate_lattices(V, K, T, sigma, delta, r, n, deltas_manual=None):
+@lru_cache(maxsize=128)
+def _precompute_tree_params(T, sigma, delta, r, n, deltas_manual=None):
+    # Everything about the tree that does not depend on V or K. Cached, so results
+    # are returned as tuples (deltas_manual must be a tuple too, to be hashable).
     dt = T / n
     sigma_effective = sigma
     u = np.exp(sigma_effective * np.sqrt(dt))
     d = 1 / u
 
-    A = [[V * (u**(j-i)) * (d**i) for j in range(n+1)] for i in range(n+1)]
-    N = [[max(A[i][j] - K, 0) for j in range(n+1)] for i in range(n+1)]
-
-    C = [[0.0]*(n+1) for _ in range(n+1)]
-
-    for i in range(n+1):
-        C[i][n] = N[i][n]
-
     discount = np.exp(-r * dt)
 
-    times = list(range(n + 1))
-    
     if deltas_manual is not None and len(deltas_manual) == n:
-        deltas = deltas_manual + [1.0]
+        deltas = np.array(deltas_manual + (1.0,))
     else:
-        deltas = [0.0] * (n + 1)
+        deltas = np.zeros(n + 1)
         if n > 0 and delta > 0:
-            g = (1.0 / delta)**(1/n) - 1
-            deltas = [delta * ((1 + g)**t) for t in times]
-            deltas[n] = 1.0 
+            # Geometric growth from delta at t=0 to exactly 1.0 at t=n
+            deltas = np.geomspace(delta, 1.0, n + 1)
         elif n == 0:
-            deltas = [delta]
+            deltas = np.array([delta])
     
-    ps_for_export = [(np.exp((r - deltas[t]) * dt) - d) / (u - d) if u != d else 0 for t in times]
+    if u != d:
+        ps_for_export = (np.exp((r - deltas) * dt) - d) / (u - d)
+    else:
+        ps_for_export = np.zeros(n + 1)
+
+    return u, d, discount, tuple(deltas.tolist()), tuple(ps_for_export.tolist())
+
+def calculate_lattices(V, K, T, sigma, delta, r, n, deltas_manual=None):
+    if deltas_manual is not None:
+        deltas_manual = tuple(deltas_manual)
+    u, d, discount, deltas, ps_for_export = _precompute_tree_params(T, sigma, delta, r, n, deltas_manual)
+
+    # Broadcast row (i = down moves) against column (j = time step) indices.
+    # Only the upper triangle (j >= i) exists in the recombining tree; the rest is
+    # zeroed, matching C, which the backward sweep never fills below the diagonal.
+    # u**k and d**k are tabulated once, so each cell is two lookups instead of two pow()s
+    steps = np.arange(n+1)
+    U = np.power(u, steps)
+    D = np.power(d, steps)
+    i_idx = steps[:, None]
+    j_idx = steps[None, :]
+    A = np.triu(V * U[(j_idx - i_idx).clip(min=0)] * D[i_idx])
+    N = np.triu(np.maximum(A - K, 0.0))
+
+    C = np.zeros((n+1, n+1))
+    C[:, n] = N[:, n]
+
+    times = list(range(n + 1))
     ps_for_induction = ps_for_export[:-1]
 
+    # Each step fills column j (rows 0..j) from column j+1 in one vectorized pass
     for j in range(n - 1, -1, -1):
         p = ps_for_induction[j] 
+        hold = discount * (p * C[:j+1, j+1] + (1-p) * C[1:j+2, j+1])
+        C[:j+1, j] = np.maximum(hold, N[:j+1, j])
+
+    return A, N, C, times, list(deltas), list(ps_for_export)
+
+def calculate_C0_only(V, K, T, sigma, delta, r, n, deltas_manual=None):
+    # C[0][0] of calculate_lattices without materializing A/N/C: only the current
+    # column of option values (length n+1) is kept and swept backwards in place.
+    if deltas_manual is not None:
+        deltas_manual = tuple(deltas_manual)
+    u, d, discount, deltas, ps_for_export = _precompute_tree_params(T, sigma, delta, r, n, deltas_manual)
+
+    steps = np.arange(n+1)
+    U = np.power(u, steps)
+    D = np.power(d, steps)
+    # Node values V * u**(j-2i) lie between V * D[n] and V * U[n] (the two terminal corners);
+    # if even the higher of them (which corner depends on the sign of V) is out of the money,
+    # all payoffs and therefore C0 are exactly zero
+    if max(V * U[n], V * D[n]) <= K:
+        return 0.0
+
+    # Node (i, j) has asset value V * U[j-i] * D[i]; U[j::-1] lists U[j-i] for i = 0..j
+    C = np.maximum(V * U[::-1] * D - K, 0.0)
+
+    for j in range(n - 1, -1, -1):
+        p = ps_for_export[j]
+        intrinsic_value = np.maximum(V * U[j::-1] * D[:j+1] - K, 0.0)
+        C[:j+1] = np.maximum(discount * (p * C[:j+1] + (1-p) * C[1:j+2]), intrinsic_value)
+
+    return C[0]
+
+@njit(cache=True, fastmath=True)
+def _c0_numba(V, K, T, sigma, delta, r, n):
+    # Same tree as calculate_lattices (auto delta schedule), but only C[0][0] is
+    # returned, so a single column of option values is swept in place.
+    dt = T / n
+    u = np.exp(sigma * np.sqrt(dt))
+    d = 1 / u
+    discount = np.exp(-r * dt)
+
+    U = np.empty(n + 1)
+    D = np.empty(n + 1)
+    for k in range(n + 1):
+        U[k] = u**k
+        D[k] = d**k
 
+    # Deep out of the money: no node has a positive payoff (see calculate_C0_only)
+    if max(V * U[n], V * D[n]) <= K:
+        return 0.0
+
+    C = np.empty(n + 1)
+    for i in range(n + 1):
+        C[i] = max(V * U[n-i] * D[i] - K, 0.0)
+
+    for j in range(n - 1, -1, -1):
+        # Auto schedule delta * (1/delta)**(j/n): the same geometric growth to 1.0 at t=n
+        # as np.geomspace in _precompute_tree_params, without forming g = (1/delta)**(1/n) - 1
+        delta_j = delta * (1.0 / delta)**(j / n) if delta > 0 else 0.0
+        p = (np.exp((r - delta_j) * dt) - d) / (u - d) if u != d else 0.0
         for i in range(j + 1):
-            intrinsic_value = N[i][j]
-            hold = discount * (p * C[i][j+1] + (1-p) * C[i+1][j+1])
-            C[i][j] = max(hold, intrinsic_value)
+            hold = discount * (p * C[i] + (1-p) * C[i+1])
+            C[i] = max(hold, V * U[j-i] * D[i] - K, 0.0)
+
+    return C[0]
 
-    return A, N, C, times, deltas, ps_for_export
+# Numba's workqueue threading layer (used when neither TBB nor OpenMP is available)
+# aborts the process if a parallel kernel is entered from two threads at once, which
+# threaded servers do; calls into _c0_batch are serialized instead.
+_c0_batch_lock = threading.Lock()
 
-def calculate_sensitivity_data(base_params, n):
+@njit(cache=True, parallel=True)
+def _c0_batch(Vs, Ks, Ts, sigmas, deltas, rs, ns):
+    # Independent pricings, spread across cores with prange
+    out = np.empty(len(Vs))
+    for k in prange(len(Vs)):
+        out[k] = _c0_numba(Vs[k], Ks[k], Ts[k], sigmas[k], deltas[k], rs[k], ns[k])
+    return out
+
+# Pay the JIT compile cost (or load it from the on-disk cache) at import time
+_c0_numba(1.0, 1.0, 1.0, 0.1, 0.0, 0.0, 1)
+_c0_batch(np.ones(1), np.ones(1), np.ones(1), np.full(1, 0.1), np.zeros(1), np.zeros(1), np.ones(1, dtype=np.int64))
+
+def calculate_sensitivity_data(base_params, n, base_option_value=None):
     V, K, T, sigma, delta, r = base_params['V_calc'], base_params['K_calc'], base_params['T'], \
                                base_params['sigma'], base_params['delta_val'], base_params['r']
     
-    def get_C0(V, K, T, sigma, delta, r, n):
-        new_n = max(1, int(T))
-        return calculate_lattices(V, K, T, sigma, delta, r, new_n)[2][0][0] / 1000
+    def get_C0_batch(*columns):
+        # columns: V, K, T, sigma, delta, r as scalars or arrays, broadcast against each other.
+        # Each run uses n = tree_steps(T); C0 (€1000s) is returned in the broadcast shape.
+        columns = np.broadcast_arrays(*(np.asarray(col, dtype=np.float64) for col in columns))
+        shape = columns[0].shape
+        # Identical runs (e.g. the factor-1.0 series shared by both line charts) are priced once
+        runs, run_index = np.unique(np.column_stack([col.ravel() for col in columns]), axis=0, return_inverse=True)
+        Vs, Ks, Ts, sigmas, deltas, rs = (np.ascontiguousarray(col) for col in runs.T)
+        ns = np.array([tree_steps(T_run) for T_run in Ts], dtype=np.int64)
+        if HAS_NUMBA:
+            with _c0_batch_lock:
+                C0 = _c0_batch(Vs, Ks, Ts, sigmas, deltas, rs, ns)
+        else:
+            # The uncompiled kernel is plain Python loops; the NumPy sweep is faster
+            C0 = np.array([calculate_C0_only(*run, int(run_n)) for *run, run_n in zip(Vs, Ks, Ts, sigmas, deltas, rs, ns)])
+        return (C0[run_index.reshape(-1)] / 1000).reshape(shape)
+
+    # Base case (unless the caller already priced it) plus the +/- 10% tornado bumps,
+    # priced together in one batch
+    runs = [(V, K, T, sigma, delta, r)] if base_option_value is None else []
 
-    base_option_value = get_C0(V, K, T, sigma, delta, r, n)
-    
-    # 1. Tornado and Spider Data (Varying each input by +/- 10%)
-    tornado_data = {}
-    spider_data = {}
     params_to_test = {
         'Asset Value (V)': V,
         'Volatility': sigma,
@@ -181,24 +394,30 @@ def calculate_sensitivity_data(base_params, n):
     }
     
     for name, base_val in params_to_test.items():
-        results = []
-        
         for factor in [0.9, 1.1]:
             if name == 'Asset Value (V)':
-                new_C = get_C0(V * factor, K, T, sigma, delta, r, n)
+                runs.append((V * factor, K, T, sigma, delta, r))
             elif name == 'Volatility':
-                new_C = get_C0(V, K, T, sigma * factor, delta, r, n)
+                runs.append((V, K, T, sigma * factor, delta, r))
             elif name == 'Time to Maturity (T)':
-                new_T = T * factor
-                new_C = get_C0(V, K, new_T, sigma, delta, r, new_T)
+                runs.append((V, K, T * factor, sigma, delta, r))
             elif name == 'Exercise Cost (K)':
-                new_C = get_C0(V, K * factor, T, sigma, delta, r, n)
+                runs.append((V, K * factor, T, sigma, delta, r))
             elif name == 'Cost of Delay':
-                new_C = get_C0(V, K, T, sigma, delta * factor, r, n)
+                runs.append((V, K, T, sigma, delta * factor, r))
             elif name == 'Risk-free Rate (r)':
-                new_C = get_C0(V, K, T, sigma, delta, r * factor, n)
-            
-            results.append(new_C)
+                runs.append((V, K, T, sigma, delta, r * factor))
+
+    C0_values = get_C0_batch(*zip(*runs)).tolist()
+    if base_option_value is None:
+        base_option_value = C0_values.pop(0)
+    
+    # 1. Tornado and Spider Data (Varying each input by +/- 10%)
+    tornado_data = {}
+    spider_data = {}
+    
+    for idx, name in enumerate(params_to_test):
+        results = C0_values[2*idx:2*idx + 2]
             
         min_C = min(results)
             
@@ -219,25 +438,28 @@ def calculate_sensitivity_data(base_params, n):
         
         spider_data[name] = round(percent_change, 2)
         
-    # 2. Line Chart 1 Data: Volatility (X) vs. Asset Value (Series)
+    # Both line charts are priced in one batch as a (chart, series, sigma) grid:
+    # chart 0 varies V per series, chart 1 varies the cost of delay
     sigma_line_range = np.linspace(sigma * 0.5, sigma * 1.5, 7).tolist()
     v_series_factors = [0.8, 1.0, 1.2]
-    
+    delta_series_factors = [0.5, 1.0, 1.5]
+
+    chart_V = V * np.array([v_series_factors, np.ones(len(v_series_factors))])[:, :, None]
+    chart_delta = delta * np.array([np.ones(len(delta_series_factors)), delta_series_factors])[:, :, None]
+    v_grid, delta_grid = np.round(get_C0_batch(chart_V, K, T, np.array(sigma_line_range), chart_delta, r), 2)
+
+    # 2. Line Chart 1 Data: Volatility (X) vs. Asset Value (Series)
     sigma_v_data = {}
-    for factor in v_series_factors:
+    for factor, c_values in zip(v_series_factors, v_grid.tolist()):
         series_v = V * factor
         series_name = f'V={round(series_v/1000)}k'
-        c_values = [round(get_C0(series_v, K, T, s, delta, r, n), 2) for s in sigma_line_range]
         sigma_v_data[series_name] = c_values
 
     # 3. Line Chart 2 Data: Volatility (X) vs. Cost of Delay (Series)
-    delta_series_factors = [0.5, 1.0, 1.5]
-    
     sigma_delta_data = {}
-    for factor in delta_series_factors:
+    for factor, c_values in zip(delta_series_factors, delta_grid.tolist()):
         series_delta = delta * factor
         series_name = f'Cost of Delay={round(series_delta*100, 1)}%'
-        c_values = [round(get_C0(V, K, T, s, series_delta, r, n), 2) for s in sigma_line_range]
         sigma_delta_data[series_name] = c_values
 
     return {
@@ -291,7 +513,7 @@ def delete_account():
     # CRITICAL FIX: Enforce Super Admin transfer protection for the specific account.
     if user.is_super_admin and user.username == SUPER_ADMIN_USERNAME:
         # Check if any other user has the super admin role
-        if User.query.filter(User.is_super_admin == True, User.id != user.id).count() == 0:
+        if db.session.query(User.id).filter(User.is_super_admin == True, User.id != user.id).first() is None:
             flash('CRITICAL: You are the last Super Admin. Transfer the Super Admin role before deleting your account.', 'danger')
             return redirect(url_for('dashboard'))
 
@@ -323,7 +545,7 @@ def admin_manage_users():
 
             if not all([username, email, password]):
                 flash('All fields are required.', 'danger')
-            elif User.query.filter((User.username == username) | (User.email == email)).first():
+            elif db.session.query(User.id).filter((User.username == username) | (User.email == email)).first() is not None:
                 flash('Username or Email already exists.', 'danger')
             elif is_super_admin and not current_user.is_super_admin:
                 flash('Only the Super Admin can create another Super Admin.', 'danger')
@@ -351,7 +573,8 @@ def admin_manage_users():
                 if user_to_delete.is_super_admin:
                     if user_to_delete.username == SUPER_ADMIN_USERNAME:
                         # Cannot delete the primary Super Admin through the portal if they are the last one.
-                        if User.query.filter_by(is_super_admin=True).count() <= 1:
+                        super_admin_count = db.session.query(func.count(User.id)).filter(User.is_super_admin == True).scalar()
+                        if super_admin_count <= 1:
                             flash('Cannot delete the last remaining primary Super Admin.', 'danger')
                             return redirect(url_for('admin_manage_users'))
 
@@ -461,19 +684,22 @@ def dashboard():
 @app.route('/api/user/history')
 @login_required
 def get_user_history():
-    # Fetch calculations belonging to the current user (Max 15 is enforced in /calculate)
-    history = Calculation.query.filter_by(user_id=current_user.id).order_by(desc(Calculation.timestamp)).all()
+    # Fetch calculations belonging to the current user (Max 15 is enforced in /calculate;
+    # the limit here is a safeguard)
+    # Only the columns the history list shows; output_summary_json is never loaded
+    history = Calculation.query.filter_by(user_id=current_user.id).with_entities(
+        Calculation.id, Calculation.timestamp, Calculation.input_params_json, Calculation.initial_option_value
+    ).order_by(desc(Calculation.timestamp)).limit(MAX_HISTORY).all()
     
     history_data = []
     for calc in history:
-        inputs = json.loads(calc.input_params_json)
-        outputs = json.loads(calc.output_summary_json)
+        inputs = orjson.loads(calc.input_params_json)
         
         history_data.append({
             'id': calc.id,
             'timestamp': calc.timestamp.strftime('%Y-%m-%d %H:%M:%S'),
             'input_params': inputs, 
-            'initial_option_value': outputs.get('initial_option_value', 'N/A')
+            'initial_option_value': calc.initial_option_value if calc.initial_option_value is not None else 'N/A'
         })
         
     return jsonify(history_data)
@@ -482,38 +708,36 @@ def get_user_history():
 @login_required 
 def calculate():
     try:
-        data  = request.get_json(force=True)
-        V_input_thousands = float(data['V'])
-        K_input_thousands = float(data['K'])
-
-        delta_mode = data.get('delta-mode', 'auto') 
-        delta_input = data['delta'] 
+        try:
+            calc_input = CalcInput.model_validate(request.get_json(force=True))
+        except ValidationError as e:
+            messages = []
+            for err in e.errors():
+                msg = err['msg'].removeprefix('Value error, ')
+                messages.append(f"{err['loc'][0]}: {msg}" if err['loc'] else msg)
+            return jsonify({'error': '; '.join(messages)}), 400
+
+        V_input_thousands = calc_input.V
+        K_input_thousands = calc_input.K
+
+        delta_mode = calc_input.delta_mode
         deltas_manual = None
         
         if delta_mode == 'auto':
-            delta_val = float(delta_input)
+            delta_val = calc_input.delta
             delta_t0 = delta_val
         else:
-            try:
-                if delta_input:
-                    deltas_manual = [float(d.strip()) for d in delta_input.split(',')]
-                else:
-                    deltas_manual = []
-            except ValueError:
-                return jsonify({'error': 'Manual Cost of Delay values must be valid numbers.'}), 400
-            
+            deltas_manual = calc_input.delta
             delta_val = deltas_manual[0] if deltas_manual else 0.0
             delta_t0 = delta_val
             
         V_calc = V_input_thousands * 1000
         K_calc = K_input_thousands * 1000
-        T     = float(data['T'])
-        sigma = float(data['sigma'])
-        r     = float(data['r'])
+        T     = calc_input.T
+        sigma = calc_input.sigma
+        r     = calc_input.r
 
-        n = int(T)
-        if n == 0:
-            n = 1
+        n = tree_steps(T)
 
         # NOTE: calculate_lattices returns 6 values: A, N, C, times(n+1), deltas(n+1), ps_for_export(n+1)
         A, N, C, times, deltas, ps_for_export = calculate_lattices(V_calc, K_calc, T, sigma, delta_val, r, n, deltas_manual) 
@@ -536,16 +760,20 @@ def calculate():
             'Cost of Delay (Manual Mode)': deltas_manual 
         }
         
-        A_thousands = [[int(round(val / 1000)) for val in row_a] for row_a in A]
-        N_thousands = [[int(round(val / 1000)) for val in row_n] for row_n in N]
-        C_thousands = [[int(round(val / 1000)) for val in row_c] for row_c in C]
+        # Integer lattices in €1000s (np.rint rounds half to even, like round())
+        A_thousands = np.rint(A / 1000).astype(np.int64)
+        N_thousands = np.rint(N / 1000).astype(np.int64)
+        C_thousands = np.rint(C / 1000).astype(np.int64)
 
         base_params = {
             'V_calc': V_calc, 'K_calc': K_calc, 'T': T, 'sigma': sigma, 
             'delta_val': delta_val, 'r': r, 'delta_t0': delta_t0, 
             'deltas_manual': deltas_manual
         }
-        sensitivity_data = calculate_sensitivity_data(base_params, n)
+        # With the auto delta schedule the main lattice is exactly the sensitivity base case,
+        # so its C0 is reused; a manual schedule differs from the auto one used by the sweep.
+        sensitivity_base = float(initial_option_value_thousands) if delta_mode == 'auto' else None
+        sensitivity_data = calculate_sensitivity_data(base_params, n, base_option_value=sensitivity_base)
 
         # Data to save for history (output summary)
         output_summary = {
@@ -555,32 +783,32 @@ def calculate():
 
         # --- SAVE CALCULATION TO DB & MANAGE LIMIT (MAX 15) ---
         if current_user.is_authenticated:
-            # Check the count
-            calc_count = Calculation.query.filter_by(user_id=current_user.id).count()
-            
-            # If count exceeds 14 (will become 15 when new one is added), delete the oldest one (ASCENDING order in model relationship)
-            if calc_count >= 15:
-                # The relationship is ordered by asc, so .first() is the oldest
-                oldest_calc = current_user.calculations.first()
-                if oldest_calc:
-                    db.session.delete(oldest_calc)
+            # Keep the newest 14 so there are 15 once the new one is added. A single DELETE
+            # driven by ix_calc_user_ts; the stale rows are never loaded into the session.
+            stale_ids = select(Calculation.id).where(Calculation.user_id == current_user.id) \
+                .order_by(desc(Calculation.timestamp)).offset(MAX_HISTORY - 1)
+            db.session.execute(
+                delete(Calculation).where(Calculation.id.in_(stale_ids)),
+                execution_options={'synchronize_session': False}
+            )
             
             # Add the new calculation
             new_calc = Calculation(
                 user_id=current_user.id,
                 input_params_json=json.dumps(input_params),
-                output_summary_json=json.dumps(output_summary)
+                output_summary_json=json.dumps(output_summary),
+                initial_option_value=float(output_summary['initial_option_value'])
             )
             db.session.add(new_calc)
             db.session.commit()
         # --- END SAVE CALCULATION ---
         
-        if data.get('export') == 'excel':
+        if calc_input.export == 'excel':
             buf = io.BytesIO()
-            with pd.ExcelWriter(buf, engine='xlsxwriter') as writer:
-                wb = writer.book
+            # constant_memory flushes each row as soon as the next one starts, so the
+            # sheet must be written strictly top to bottom
+            with xlsxwriter.Workbook(buf, {'constant_memory': True}) as wb:
                 ws = wb.add_worksheet('tree')
-                writer.sheets['tree'] = ws
 
                 hdr_fmt = wb.add_format({'bold': True, 'bg_color': '#f0f0f0', 'border': 1})
                 float_fmt = wb.add_format({'num_format': '0.0000'})
@@ -612,38 +840,26 @@ def calculate():
                 ws.merge_range(row, 0, row, 2, 'Time-Variant Inputs', section_hdr)
                 row += 1
                 
-                tv_data = {
-                    't':              times,
-                    '$\delta$ (delay cost)':   deltas,
-                    # Using the ps_for_export list (length n+1) 
-                    'p (up-move prob)': ps_for_export
-                }
-                # This line should now succeed because all lists (times, deltas, ps_for_export) are length n+1
-                tv = pd.DataFrame(tv_data)
-                
                 ws.write_row(row + 1, 0, ['t', '$\delta$ (delay cost)', 'p (up-move prob)'], hdr_fmt)
                 
-                for r_idx in range(len(tv)):
-                    ws.write_number(row + 2 + r_idx, 0, tv.loc[r_idx, 't'], int_fmt)
-                    ws.write_number(row + 2 + r_idx, 1, tv.loc[r_idx, '$\delta$ (delay cost)'], float_fmt)
-                    
-                    p_val = tv.loc[r_idx, 'p (up-move prob)']
-                    ws.write_number(row + 2 + r_idx, 2, p_val, float_fmt)
+                # times, deltas and ps_for_export are all length n+1
+                for r_idx, (t, delta_t, p_val) in enumerate(zip(times, deltas, ps_for_export)):
+                    ws.write_number(row + 2 + r_idx, 0, t, int_fmt)
+                    ws.write_row(row + 2 + r_idx, 1, [delta_t, p_val], float_fmt)
                         
-                row += len(tv) + 3
+                row += len(times) + 3
 
-                def write_lattice(df, title, start_row):
+                def write_lattice(lattice, title, start_row):
                     ws.merge_range(start_row, 0, start_row, n+1, title, section_hdr)
-                    df.to_excel(writer, sheet_name='tree', startrow=start_row+2, startcol=0, header=True, index=True, float_format='0')
-                    return start_row + len(df) + 4
+                    ws.write_row(start_row + 2, 1, [f't={t}' for t in times], hdr_fmt)
+                    for i, lattice_row in enumerate(lattice.tolist()):
+                        ws.write(start_row + 3 + i, 0, f'i={i}', hdr_fmt)
+                        ws.write_row(start_row + 3 + i, 1, lattice_row)
+                    return start_row + len(lattice) + 4
 
-                dfA = pd.DataFrame(A_thousands, index=[f'i={i}' for i in times], columns=[f't={t}' for t in times])
-                dfN = pd.DataFrame(N_thousands, index=[f'i={i}' for i in times], columns=[f't={t}' for t in times])
-                dfC = pd.DataFrame(C_thousands, index=[f'i={i}' for i in times], columns=[f't={t}' for t in times])
-
-                row = write_lattice(dfA, 'Asset-Value Lattice (A)', row)
-                row = write_lattice(dfN, 'Net-Value Lattice (N)', row)
-                write_lattice(dfC, 'Option-Value Lattice (C)', row)
+                row = write_lattice(A_thousands, 'Asset-Value Lattice (A)', row)
+                row = write_lattice(N_thousands, 'Net-Value Lattice (N)', row)
+                write_lattice(C_thousands, 'Option-Value Lattice (C)', row)
 
             buf.seek(0)
             return send_file(
@@ -653,13 +869,15 @@ def calculate():
                 mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
             )
 
-        return jsonify({
+        # orjson serializes the lattice arrays straight from their buffers; keys are
+        # sorted to keep the same output as jsonify
+        return Response(orjson.dumps({
             'summary': {'initial_option_value': round(initial_option_value_thousands, 4)},
             'asset':  A_thousands,
             'net':    N_thousands,
             'option': C_thousands,
             'sensitivity': sensitivity_data
-        })
+        }, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_SORT_KEYS), mimetype='application/json')
 
     except Exception as e:
         # Ensures that errors during calculation or export are visible in the console